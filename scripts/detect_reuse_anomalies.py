@@ -1,58 +1,68 @@
 #!/usr/bin/env python3
 """Detects content reuse anomalies by analyzing content hash patterns across domains."""
 
-import json
 import os
+import sys
 import argparse
-from collections import defaultdict
 from pathlib import Path
-from typing import Dict, List, Any
+from typing import Dict, List, Optional, Any
+
+import orjson
+import simdjson
 
 def load_json_file(file_path: str) -> Dict[str, Any]:
     """Load JSON data from a file."""
-    with open(file_path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(file_path, "rb") as f:
+        return orjson.loads(f.read())
+
+def load_reuse_map(file_path: str) -> Dict[str, Any]:
+    """Load the reuse map, parsing it lazily with simdjson.
 
-def save_json_file(data: Any, file_path: str) -> None:
-    """Save data to a JSON file, creating parent directories if needed."""
+    Only the source domains are read, so snippets and URLs are never turned into Python objects.
+    """
+    with open(file_path, "rb") as f:
+        return simdjson.Parser().parse(f.read())
+
+def save_json_file(data: Any, file_path: str, pretty: bool = False) -> None:
+    """Save data to a JSON file, creating parent directories if needed. Output is compact unless pretty is set."""
     os.makedirs(os.path.dirname(file_path), exist_ok=True)
-    with open(file_path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    option = orjson.OPT_NON_STR_KEYS | (orjson.OPT_INDENT_2 if pretty else 0)
+    with open(file_path, "wb") as f:
+        f.write(orjson.dumps(data, option=option))
 
 def detect_anomalies(reuse_map: Dict[str, Any], domain_labels: Dict[str, str]) -> List[Dict[str, Any]]:
     """Analyze content reuse patterns and detect anomalies."""
     anomalies = []
+    get_label = domain_labels.get
+    # A domain's label never changes, so every group shares one {"domain", "label"} entry per domain
+    entries: Dict[str, Dict[str, str]] = {}
 
     for content_hash, group in reuse_map.items():
         sources = group.get("sources", [])
 
-        label_groups = defaultdict(list)
+        # Every issue needs at least two sources and with two or more the high frequency
+        # rule always wins, so the cross-ideological (2+ labels) and unclassified cluster
+        # (3+ sources) rules can never fire and labels are only needed for the output
+        if len(sources) < 2:
+            continue
+
+        reused_on = []
         for item in sources:
             domain = item["domain"]
-            label = domain_labels.get(domain, "unclassified")
-            label_groups[label].append(domain)
+            entry = entries.get(domain)
+            if entry is None:
+                entry = entries[domain] = {"domain": domain, "label": get_label(domain, "unclassified")}
+            reused_on.append(entry)
 
-        labels_used = list(label_groups.keys())
-
-        anomaly_info = {
+        anomalies.append({
             "content_hash": content_hash,
-            "reused_on": [
-                {"domain": item["domain"], "label": domain_labels.get(item["domain"], "unclassified")}
-                for item in sources
-            ]
-        }
-
-        if len(sources) >= 2:
-            anomalies.append({**anomaly_info, "issue": "High frequency reuse"})
-        elif len(labels_used) >= 2:
-            anomalies.append({**anomaly_info, "issue": "Cross-ideological reuse"})
-        elif (all(domain_labels.get(item["domain"], "unclassified") == "unclassified" for item in sources)
-              and len(sources) >= 3):
-            anomalies.append({**anomaly_info, "issue": "Unclassified cluster reuse"})
+            "reused_on": reused_on,
+            "issue": "High frequency reuse"
+        })
 
     return anomalies
 
-def main():
+def main(argv: Optional[List[str]] = None):
     DEFAULT_INPUT_PATH = "data/analysis/reuse_map.json"
     DEFAULT_LABELS_PATH = "data/output/new_source_labels.json"
     DEFAULT_OUTPUT_PATH = "data/analysis/reuse_anomalies.json"
@@ -79,19 +89,24 @@ def main():
         default=DEFAULT_OUTPUT_PATH,
         help="Output path for anomalies JSON file"
     )
+    parser.add_argument(
+        "--pretty",
+        action="store_true",
+        help="Indent the output JSON for reading instead of writing it compact"
+    )
     parser.add_argument(
         "--verbose", "-v",
         action="store_true",
         help="Show detailed processing information"
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     try:
-        reuse_map = load_json_file(args.input_path)
+        reuse_map = load_reuse_map(args.input_path)
         domain_labels = load_json_file(args.labels_path)
         anomalies = detect_anomalies(reuse_map, domain_labels)
-        save_json_file(anomalies, args.output_path)
+        save_json_file(anomalies, args.output_path, pretty=args.pretty)
         print(f"[✓] Found {len(anomalies)} suspicious reuse cases. Saved to {args.output_path}")
     except Exception as e:
         print(f"[✗] Error: {e}", file=sys.stderr)
@@ -2,37 +2,74 @@
 """Analyzes domain frequency from crawled JSON data."""
 
 import os
-import json
+import sys
+import re
+import itertools
+import multiprocessing as mp
 from collections import Counter
+from functools import lru_cache
 from pathlib import Path
-import tldextract
+from typing import Any, Iterator, List, Optional
 import argparse
 
+import ijson
+import orjson
+
+from common.domains import EXTRACT
+
+# Public suffix rules, including "*." wildcard and "!" exception rules, from the extractor's list
+PSL = frozenset(EXTRACT.tlds)
+
+# Host of an http(s) URL, skipping any userinfo and stopping at port, path, query or fragment
+_HOST_RE = re.compile(r"https?://(?:[^/?#@]*@)?([^/:?#]+)", re.IGNORECASE)
+
+@lru_cache(maxsize=200_000)
+def _host_to_domain(host: str) -> Optional[str]:
+    """Return the registered domain of a host from the suffix rules, or None if no rule matches."""
+    labels = host.split(".")
+    # Walk from the longest candidate suffix, the first rule hit is the longest match
+    for i in range(len(labels)):
+        suffix = ".".join(labels[i:])
+        if "!" + suffix in PSL:
+            return suffix
+        if suffix in PSL or (i + 1 < len(labels) and "*." + ".".join(labels[i + 1:]) in PSL):
+            return f"{labels[i - 1]}.{suffix}" if i else None
+    return None
+
+@lru_cache(maxsize=200_000)
 def extract_domain(url: str) -> str:
-    """Extract domain from URL using tldextract."""
+    """Extract domain from URL, falling back to tldextract for hosts the suffix rules can't resolve."""
     try:
-        extracted = tldextract.extract(url)
-        return f"{extracted.domain}.{extracted.suffix}"
+        match = _HOST_RE.match(url)
+        domain = _host_to_domain(match.group(1).lower()) if match else None
+        if domain:
+            return domain
+        extracted = EXTRACT(url)
+        return f"{extracted.domain}.{extracted.suffix}".lower()
     except Exception:
         return None
 
-def load_labeled_urls(directory: str) -> Counter:
-    """Load and count domains from all JSON files that ends with 'labled'"""
-    domain_counter = Counter()
-
-    for filename in os.listdir(directory):
-        if not filename.endswith(".json") or "labeled" in filename:
-            continue
+def iter_items(path: str) -> Iterator[Any]:
+    """Yield the top-level items of a crawl JSON file, streaming them with ijson.
 
-        path = os.path.join(directory, filename)
-        try:
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-        except json.JSONDecodeError:
-            print(f"[!] Skipping {filename} due to JSON error")
-            continue
+    Arrays yield their elements and objects yield their keys, as iterating the
+    loaded document would, any other top-level value yields nothing.
+    """
+    with open(path, "rb") as f:
+        events = ijson.parse(f)
+        first = next(events, None)
+        if first is None:
+            return
+        if first[1] == "start_array":
+            yield from ijson.items(itertools.chain([first], events), "item")
+        elif first[1] == "start_map":
+            yield from (value for prefix, event, value in events if prefix == "" and event == "map_key")
 
-        for item in data:
+def _count_file(path: str) -> Counter:
+    """Count domains in a single crawl file, an invalid file counts as empty."""
+    counter = Counter()
+    try:
+        for item in iter_items(path):
             url = None
             if isinstance(item, dict):
                 url = item.get("source") or item.get("url")
@@ -42,17 +79,40 @@ def load_labeled_urls(directory: str) -> Counter:
             if url:
                 domain = extract_domain(url)
                 if domain:
-                    domain_counter[domain] += 1
+                    counter[domain] += 1
+    except ijson.JSONError:
+        print(f"[!] Skipping {os.path.basename(path)} due to JSON error")
+        return Counter()
+    return counter
+
+def load_labeled_urls(directory: str) -> Counter:
+    """Load and count domains from all JSON files that ends with 'labled'"""
+    paths = [
+        entry.path for entry in os.scandir(directory)
+        if entry.name.endswith(".json") and "labeled" not in entry.name and entry.is_file()
+    ]
+    domain_counter = Counter()
+
+    if len(paths) < 2:
+        for path in paths:
+            domain_counter.update(_count_file(path))
+        return domain_counter
+
+    # Files are independent, count them in parallel and merge the partial counters in listing order
+    with mp.Pool(processes=min(len(paths), os.cpu_count() or 1)) as pool:
+        for counts in pool.imap(_count_file, paths):
+            domain_counter.update(counts)
 
     return domain_counter
 
 def save_report(counter: Counter, output_path: str) -> None:
     """Save domain frequency report as JSON."""
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    with open(output_path, "w", encoding="utf-8") as f:
-        json.dump(dict(counter.most_common()), f, indent=2)
+    report = dict(counter.most_common())
+    with open(output_path, "wb") as f:
+        f.write(orjson.dumps(report, option=orjson.OPT_INDENT_2))
 
-def main():
+def main(argv: Optional[List[str]] = None):
     DEFAULT_INPUT_DIR="data/output"
     DEFAULT_OUTPUT_PATH="data/output/domain_frequency_report.json"
 
@@ -78,7 +138,7 @@ def main():
         help="Show detailed processing information"
     )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     try:
         print(f"[*] Analyzing domain frequency in {args.input_dir}...")
@@ -2,29 +2,150 @@
 """Domain enrichment tool that gathers WHOIS, subdomains, and certificate data."""
 
 import os
-import json
 import time
+import contextlib
 import argparse
+import sqlite3
 import subprocess
+import sys
+import tempfile
+import threading
 import requests
 import whois
+from collections import defaultdict
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from cryptography import x509
 from cryptography.hazmat.backends import default_backend
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from pathlib import Path
-from typing import Dict, List, Optional, Any
+from typing import Dict, Iterable, Iterator, List, Optional, Any
+
+import ijson
+import orjson
+
+def load_json_file(file_path: str) -> Any:
+    """Load JSON data from a file."""
+    with open(file_path, "rb") as f:
+        return orjson.loads(f.read())
+
+def save_json_file(data: Any, file_path: str, pretty: bool = False) -> None:
+    """Save data to a JSON file. Output is compact unless pretty is set."""
+    with open(file_path, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 if pretty else None))
+
+def read_cache_file(path: str, ttl: float) -> Optional[Any]:
+    """Return the JSON cached at path, or None if it is missing, unreadable or older than ttl seconds."""
+    try:
+        if time.time() - os.path.getmtime(path) < ttl:
+            return load_json_file(path)
+    except (OSError, ValueError):
+        pass
+    return None
+
+def write_cache_file(path: str, content: bytes) -> None:
+    """Atomically write content to path so a concurrent reader never sees a partial file."""
+    write_cache_stream(path, (content,))
+
+def write_cache_stream(path: str, chunks: Iterable[bytes]) -> None:
+    """Atomically write a stream of chunks to path so a concurrent reader never sees a partial file."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+    except BaseException:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+def iter_json_items(path: str) -> Iterator[Any]:
+    """Yield the top-level array items of a JSON file, streaming them with ijson."""
+    with open(path, "rb") as f:
+        yield from ijson.items(f, "item")
+
+def fetch_whois(domain: str) -> Dict[str, Any]:
+    """Fetch WHOIS information for a domain."""
+    try:
+        w = whois.whois(domain)
+        org = w.org or w.get("name") or w.get("registrant_name")
+        emails = w.emails if isinstance(w.emails, list) else [w.emails] if w.emails else []
+
+        return {
+            "registrar": w.registrar,
+            "creation_date": str(w.creation_date),
+            "emails": emails,
+            "org": org
+        }
+    except Exception as e:
+        print(f"[!] WHOIS failed for {domain}: {e}")
+        return {}
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `burst` calls at once and one more every `interval` seconds."""
+
+    def __init__(self, interval: float, burst: int = 1):
+        self.interval = interval
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Take a token, sleeping until it is due."""
+        with self._lock:
+            now = time.monotonic()
+            if self.interval > 0:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) / self.interval)
+            else:
+                self._tokens = self.burst
+            self._updated = now
+            # Tokens may go negative, which reserves later slots for the callers queued behind us
+            self._tokens -= 1
+            wait = -self._tokens * self.interval if self._tokens < 0 else 0
+        if wait:
+            time.sleep(wait)
 
 class DomainEnricher:
-    def __init__(self, cache_dir: str = ".cache/certs", rate_limit_delay: int = 12, max_certs: int = 1):
+    CRTSH_INDEX_TTL = 24 * 3600
+    WHOIS_TTL = 7 * 24 * 3600
+
+    def __init__(
+        self,
+        cache_dir: str = ".cache/certs",
+        rate_limit_delay: int = 12,
+        max_certs: int = 1,
+        include_expired: bool = False
+    ):
         self.cache_dir = cache_dir
         self.rate_limit_delay = rate_limit_delay
         self.max_certs = max_certs
-        self.last_request_time = 0
+        self.include_expired = include_expired
+        # Shared by all worker threads so the crt.sh rate limit holds globally
+        self.crtsh_bucket = TokenBucket(rate_limit_delay)
+        # Keep-alive session so crt.sh requests reuse connections instead of a new TLS handshake each
+        self.session = requests.Session()
+        self.session.headers.update({"Accept-Encoding": "gzip", "User-Agent": "echosnare"})
+        adapter = HTTPAdapter(
+            pool_connections=16,
+            pool_maxsize=16,
+            max_retries=Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 502, 503, 504])
+        )
+        self.session.mount("https://", adapter)
         os.makedirs(self.cache_dir, exist_ok=True)
+        # Single SQLite store for cached certificates, shared by the worker threads
+        self._db = sqlite3.connect(os.path.join(self.cache_dir, "certs.db"), check_same_thread=False)
+        self._db_lock = threading.Lock()
+        with self._db_lock, self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS certs (id INTEGER PRIMARY KEY, body BLOB NOT NULL)")
+        self._import_legacy_cache()
 
     def extract_domains(self, input_file: str) -> List[str]:
         """Extract domains from input JSON file."""
-        with open(input_file, "r") as f:
-            data = json.load(f)
+        data = load_json_file(input_file)
         return list(data.keys())
 
     def run_subfinder(self, domain: str) -> List[str]:
@@ -40,36 +161,61 @@ class DomainEnricher:
             print(f"[!] subfinder failed for {domain}: {e}")
             return []
 
-    def fetch_whois(self, domain: str) -> Dict[str, Any]:
-        """Fetch WHOIS information for a domain."""
-        try:
-            w = whois.whois(domain)
-            org = w.org or w.get("name") or w.get("registrant_name")
-            emails = w.emails if isinstance(w.emails, list) else [w.emails] if w.emails else []
+    def run_subfinder_batch(self, domains: List[str]) -> Dict[str, List[str]]:
+        """Run subfinder once over all domains and group the discovered subdomains by domain."""
+        subdomains: Dict[str, List[str]] = {domain: [] for domain in domains}
+        with tempfile.NamedTemporaryFile("w", suffix=".txt", delete=False) as f:
+            f.write("\n".join(domains))
+            domain_list = f.name
 
-            return {
-                "registrar": w.registrar,
-                "creation_date": str(w.creation_date),
-                "emails": emails,
-                "org": org
-            }
+        try:
+            # JSON lines output tags every subdomain with the input domain it was found for
+            with subprocess.Popen(
+                ["subfinder", "-dL", domain_list, "-silent", "-oJ"],
+                stdout=subprocess.PIPE,
+                text=True
+            ) as proc:
+                for line in proc.stdout:
+                    try:
+                        record = orjson.loads(line)
+                    except ValueError:
+                        continue
+                    host = record.get("host")
+                    if host and record.get("input") in subdomains:
+                        subdomains[record["input"]].append(host)
         except Exception as e:
-            print(f"[!] WHOIS failed for {domain}: {e}")
-            return {}
+            print(f"[!] subfinder failed: {e}")
+        finally:
+            os.remove(domain_list)
+        return subdomains
+
+    def _import_legacy_cache(self) -> None:
+        """Move certificates cached as individual .der files into the database."""
+        legacy = [entry for entry in os.scandir(self.cache_dir) if entry.name.endswith(".der")]
+        if not legacy:
+            return
+        with self._db_lock, self._db:
+            for entry in legacy:
+                with open(entry.path, "rb") as f:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO certs (id, body) VALUES (?, ?)",
+                        (entry.name[:-len(".der")], f.read())
+                    )
+        for entry in legacy:
+            os.remove(entry.path)
+        print(f"[*] Imported {len(legacy)} cached certificates into {self.cache_dir}/certs.db")
 
     def _load_from_cache(self, cert_id: str) -> Optional[bytes]:
         """Load certificate from cache if exists."""
-        path = os.path.join(self.cache_dir, f"{cert_id}.der")
-        if os.path.exists(path):
-            with open(path, "rb") as f:
-                return f.read()
-        return None
+        with self._db_lock:
+            row = self._db.execute("SELECT body FROM certs WHERE id = ?", (cert_id,)).fetchone()
+        return row[0] if row else None
 
     def _save_to_cache(self, cert_id: str, content: bytes) -> None:
         """Save certificate to cache."""
-        path = os.path.join(self.cache_dir, f"{cert_id}.der")
-        with open(path, "wb") as f:
-            f.write(content)
+        # Downloads are rate limited to one every few seconds, so committing per cert is cheap
+        with self._db_lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO certs (id, body) VALUES (?, ?)", (cert_id, content))
 
     def _download_cert(self, cert_id: str) -> Optional[bytes]:
         """Download certificate from crt.sh with rate limiting."""
@@ -77,23 +223,19 @@ class DomainEnricher:
         if cached:
             return cached
 
-        now = time.time()
-        elapsed = now - self.last_request_time
-        if elapsed < self.rate_limit_delay:
-            time.sleep(self.rate_limit_delay - elapsed)
+        self.crtsh_bucket.acquire()
 
         try:
             url = f"https://crt.sh/?d={cert_id}"
-            resp = requests.get(url, timeout=15)
-            self.last_request_time = time.time()
-
-            if resp.status_code == 200:
-                if b"<html" in resp.content[:100].lower():
-                    print(f"[!] Skipped HTML page for cert {cert_id}")
-                    return None
-                self._save_to_cache(cert_id, resp.content)
-                return resp.content
-            print(f"[!] Error {resp.status_code} for cert {cert_id}")
+            # Streamed so an HTML error page is rejected from its headers without reading the body
+            with self.session.get(url, timeout=15, stream=True) as resp:
+                if resp.status_code == 200:
+                    if "html" in resp.headers.get("Content-Type", "").lower():
+                        print(f"[!] Skipped HTML page for cert {cert_id}")
+                        return None
+                    self._save_to_cache(cert_id, resp.content)
+                    return resp.content
+                print(f"[!] Error {resp.status_code} for cert {cert_id}")
         except Exception as e:
             print(f"[!] Request failed for cert {cert_id}: {e}")
         return None
@@ -126,78 +268,143 @@ class DomainEnricher:
             print(f"[!] Failed to parse cert: {e}")
             return None
 
+    def lookup_whois(self, domains: List[str], workers: int) -> Dict[str, Dict[str, Any]]:
+        """Fetch WHOIS information for many domains, reusing results cached within WHOIS_TTL."""
+        results = {}
+        missing = []
+        for domain in domains:
+            cached = read_cache_file(os.path.join(self.cache_dir, "whois", f"{domain}.json"), self.WHOIS_TTL)
+            if cached is None:
+                missing.append(domain)
+            else:
+                results[domain] = cached
+
+        if missing:
+            # python-whois is not thread safe, so the lookups run in worker processes
+            with ProcessPoolExecutor(max_workers=workers) as whois_pool:
+                for domain, info in zip(missing, whois_pool.map(fetch_whois, missing)):
+                    results[domain] = info
+                    # Failed lookups come back empty and are retried on the next run
+                    if info:
+                        write_cache_file(os.path.join(self.cache_dir, "whois", f"{domain}.json"), orjson.dumps(info))
+
+        return results
+
+    def _fetch_crtsh_index(self, domain: str) -> Optional[str]:
+        """Return the path of the crt.sh certificate index for a domain, downloading it unless cached within CRTSH_INDEX_TTL."""
+        # Indexes with and without expired certificates are different queries, cache them separately
+        index_name = f"{domain}.all.json" if self.include_expired else f"{domain}.json"
+        index_path = os.path.join(self.cache_dir, "crtsh_json", index_name)
+        try:
+            if time.time() - os.path.getmtime(index_path) < self.CRTSH_INDEX_TTL:
+                return index_path
+        except OSError:
+            pass
+
+        url = f"https://crt.sh/?q=%25.{domain}&output=json"
+        if not self.include_expired:
+            # Let crt.sh drop expired certificates instead of downloading them under the rate limit and keeping them
+            url += "&exclude=expired"
+        # Index searches are the heaviest crt.sh queries, they share the certificate downloads' rate limit
+        self.crtsh_bucket.acquire()
+        # Popular domains have indexes of tens of MB, stream the body straight to disk instead of holding it in memory
+        with self.session.get(url, timeout=15, stream=True) as resp:
+            if resp.status_code != 200:
+                print(f"[!] Error {resp.status_code} for crt.sh index of {domain}")
+                return None
+            # crt.sh answers some failures with a 200 HTML page, which must not be cached as the index
+            if "json" not in resp.headers.get("Content-Type", "").lower():
+                print(f"[!] Skipped non-JSON crt.sh index for {domain}")
+                return None
+            write_cache_stream(index_path, resp.iter_content(chunk_size=64 * 1024))
+        return index_path
+
     def fetch_crtsh(self, domain: str) -> List[Dict[str, Any]]:
         """Fetch certificate information from crt.sh."""
         try:
-            url = f"https://crt.sh/?q=%25.{domain}&output=json"
-            resp = requests.get(url, timeout=15)
-            if resp.status_code != 200:
+            index_path = self._fetch_crtsh_index(domain)
+            if index_path is None:
                 return []
 
-            certs = resp.json()
             seen_serials = set()
             results = []
+            # Matches the domain itself, its subdomains and wildcards, but not look-alikes such as barfoo.com for foo.com
+            subdomain_suffix = f".{domain}"
 
-            for cert in certs:
-                if len(results) >= self.max_certs:
-                    break
+            # Entries are parsed lazily, so stopping at max_certs skips the rest of the index
+            try:
+                for cert in iter_json_items(index_path):
+                    if len(results) >= self.max_certs:
+                        break
 
-                cert_id = cert.get("id")
-                if not cert_id:
-                    continue
-
-                content = self._download_cert(cert_id)
-                if not content:
-                    continue
+                    cert_id = cert.get("id")
+                    if not cert_id:
+                        continue
 
-                cert_info = self._parse_cert(content)
-                if cert_info:
-                    fingerprint = (cert_info["issuer"], cert_info["serial_number"])
-                    if fingerprint in seen_serials:
+                    content = self._download_cert(cert_id)
+                    if not content:
                         continue
-                    seen_serials.add(fingerprint)
 
-                    if any(domain in d or f"*.{domain}" in d for d in cert_info["san_domains"]):
-                        results.append(cert_info)
+                    cert_info = self._parse_cert(content)
+                    if cert_info:
+                        fingerprint = (cert_info["issuer"], cert_info["serial_number"])
+                        if fingerprint in seen_serials:
+                            continue
+                        seen_serials.add(fingerprint)
+
+                        san_domains = set(cert_info["san_domains"])
+                        if domain in san_domains or any(d.endswith(subdomain_suffix) for d in san_domains):
+                            results.append(cert_info)
+            except ijson.JSONError as e:
+                # A truncated or corrupt index would fail every lookup until it expires, drop it so the next run refetches
+                print(f"[!] Discarded invalid crt.sh index for {domain}: {e}")
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(index_path)
 
             return results
         except Exception as e:
             print(f"[!] crt.sh lookup failed for {domain}: {e}")
             return []
 
-    def enrich_domain(self, domain: str) -> Dict[str, Any]:
-        """Enrich domain with subdomains, certificates, and WHOIS data."""
+    def enrich_domain(
+        self,
+        domain: str,
+        whois_info: Optional[Dict[str, Any]] = None,
+        subdomains: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Enrich domain with subdomains, certificates, and WHOIS data (looked up here unless given)."""
         print(f"[*] Enriching: {domain}")
         return {
-            "subfinder_subdomains": self.run_subfinder(domain),
+            "subfinder_subdomains": self.run_subfinder(domain) if subdomains is None else subdomains,
             "crtsh_certificates": self.fetch_crtsh(domain),
-            "whois": self.fetch_whois(domain)
+            "whois": fetch_whois(domain) if whois_info is None else whois_info
         }
 
     def generate_reverse_san_index(self, enriched_data: Dict[str, Any]) -> Dict[str, Any]:
         """Generate reverse index of SAN domains."""
-        reverse_index = {}
+        reverse_index = defaultdict(list)
         for domain, data in enriched_data.items():
             for cert in data.get("crtsh_certificates", []):
-                serial = cert["serial_number"]
-                for san_domain in cert["san_domains"]:
-                    if san_domain not in reverse_index:
-                        reverse_index[san_domain] = []
-                    reverse_index[san_domain].append({
-                        "shared_with": domain,
-                        "serial_number": serial,
-                        "issuer": cert["issuer"],
-                        "not_before": cert["not_before"],
-                        "not_after": cert["not_after"]
-                    })
-        return reverse_index
-
-def main():
+                # The record is the same for every SAN on the certificate, build it once
+                record = {
+                    "shared_with": domain,
+                    "serial_number": cert["serial_number"],
+                    "issuer": cert["issuer"],
+                    "not_before": cert["not_before"],
+                    "not_after": cert["not_after"]
+                }
+                # Some certificates repeat a SAN entry, index each name once per certificate (keeping SAN order)
+                for san_domain in dict.fromkeys(cert["san_domains"]):
+                    reverse_index[san_domain].append(record)
+        return dict(reverse_index)
+
+def main(argv: Optional[List[str]] = None):
     DEFAULT_INPUT_PATH = "data/output/new_source_labels.json"
     DEFAULT_OUTPUT_DIR = "data/enrichment"
     DEFAULT_CACHE_DIR = ".cache/certs"
     DEFAULT_RATE_LIMIT = 12
     DEFAULT_MAX_CERTS = 3
+    DEFAULT_WORKERS = 8
 
     parser = argparse.ArgumentParser(
         description="Domain enrichment tool to gather WHOIS, subdomains, and certificate data",
@@ -233,29 +440,67 @@ def main():
         default=DEFAULT_MAX_CERTS,
         help="Max certificates to fetch per domain"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Number of domains to enrich concurrently"
+    )
+    parser.add_argument(
+        "--pretty",
+        action="store_true",
+        help="Indent the output JSON for reading instead of writing it compact"
+    )
+    parser.add_argument(
+        "--include-expired",
+        action="store_true",
+        help="Also consider expired certificates from crt.sh"
+    )
+    parser.add_argument(
+        "--verbose", "-v",
+        action="store_true",
+        help="Show detailed processing information"
+    )
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     try:
         os.makedirs(args.output_dir, exist_ok=True)
-        enricher = DomainEnricher(args.cache_dir, args.rate_limit, args.max_certs)
+        enricher = DomainEnricher(args.cache_dir, args.rate_limit, args.max_certs, args.include_expired)
 
         print(f"[*] Processing domains from {args.input_path}")
         domains = enricher.extract_domains(args.input_path)
-        enriched = {}
-
-        for domain in domains:
-            enriched[domain] = enricher.enrich_domain(domain)
-            time.sleep(2)
+        certificates = {}
+
+        # Runs before any worker thread exists, so the WHOIS process pool never forks a threaded parent
+        whois_info = enricher.lookup_whois(domains, args.workers)
+
+        with ThreadPoolExecutor(max_workers=1) as background, \
+                ThreadPoolExecutor(max_workers=args.workers) as executor:
+            # The single subfinder run proceeds alongside the rate limited crt.sh lookups
+            subfinder_future = background.submit(enricher.run_subfinder_batch, domains)
+            futures = {executor.submit(enricher.fetch_crtsh, domain): domain for domain in domains}
+            for future in as_completed(futures):
+                certificates[futures[future]] = future.result()
+                print(f"[*] Fetched certificates for {futures[future]}")
+            subdomains = subfinder_future.result()
+
+        # Keep the input order in the output file
+        enriched = {
+            domain: {
+                "subfinder_subdomains": subdomains[domain],
+                "crtsh_certificates": certificates[domain],
+                "whois": whois_info[domain]
+            }
+            for domain in domains
+        }
 
         output_file = os.path.join(args.output_dir, "domain_enrichment.json")
-        with open(output_file, "w") as f:
-            json.dump(enriched, f, indent=2)
+        save_json_file(enriched, output_file, pretty=args.pretty)
         print(f"[✓] Enrichment complete. Saved to {output_file}")
 
         reverse_index = enricher.generate_reverse_san_index(enriched)
         reverse_index_file = os.path.join(args.output_dir, "reverse_san_index.json")
-        with open(reverse_index_file, "w") as f:
-            json.dump(reverse_index, f, indent=2)
+        save_json_file(reverse_index, reverse_index_file, pretty=args.pretty)
         print(f"[✓] Reverse SAN index saved to {reverse_index_file}")
     except Exception as e:
         print(f"[✗] Error: {e}", file=sys.stderr)
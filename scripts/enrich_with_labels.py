@@ -1,13 +1,15 @@
 #!/usr/bin/env python3
 """Enrich crawl data with domain labels."""
 
-import json
-import os
 import sys
 import argparse
 from pathlib import Path
-from typing import Dict, List, Set, Any
-import tldextract
+from typing import Dict, Set, Any
+from urllib.parse import urlparse
+
+import orjson
+
+from common.domains import netloc_to_domain
 
 def load_json(path: str) -> Any:
     """Load JSON data from file."""
@@ -16,16 +18,16 @@ def load_json(path: str) -> Any:
         raise FileNotFoundError(f"Input file not found: {path}")
     if not path_obj.is_file():
         raise ValueError(f"Path is not a file: {path}")
-    with open(path, 'r', encoding='utf-8') as f:
-        return json.load(f)
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
 
 def save_json(data: Any, path: str) -> None:
     """Save data to JSON file."""
     path_obj = Path(path)
     try:
         path_obj.parent.mkdir(parents=True, exist_ok=True)
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=2, ensure_ascii=False)
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
     except PermissionError:
         raise PermissionError(f"Cannot write to output file: {path}")
     except Exception as e:
@@ -34,15 +36,21 @@ def save_json(data: Any, path: str) -> None:
 def extract_domain(url: str) -> str:
     """Extract registered domain from URL."""
     try:
-        extracted = tldextract.extract(url)
-        return f"{extracted.domain}.{extracted.suffix}"
+        return netloc_to_domain(urlparse(url).netloc or url)
     except Exception as e:
         raise ValueError(f"Failed to extract domain from URL: {url} - {e}")
 
 class DataEnricher:
     def __init__(self, labels: Dict[str, str]):
         self.labels = labels
-        self.unmatched_domains: Set[str] = set()
+        self.seen_domains: Set[str] = set()
+
+    @property
+    def unmatched_domains(self) -> Set[str]:
+        """Domains seen so far that have no label, or are explicitly labeled 'unclassified'."""
+        # Checked once per distinct domain here rather than once per entry in process_entry
+        get_label = self.labels.get
+        return {domain for domain in self.seen_domains if get_label(domain, "unclassified") == "unclassified"}
 
     def process_entry(self, entry: Dict[str, Any]) -> Dict[str, Any]:
         """Add label to a single crawl entry."""
@@ -53,12 +61,8 @@ class DataEnricher:
                 return entry
 
             domain = extract_domain(url)
-            label = self.labels.get(domain, "unclassified")
-
-            if label == "unclassified":
-                self.unmatched_domains.add(domain)
-
-            entry["label"] = label
+            self.seen_domains.add(domain)
+            entry["label"] = self.labels.get(domain, "unclassified")
             return entry
         except Exception as e:
             print(f"[!] Error processing entry: {e}")
@@ -67,12 +71,13 @@ class DataEnricher:
 
     def report_unmatched(self) -> None:
         """Print warning about unmatched domains."""
-        if not self.unmatched_domains:
+        unmatched_domains = self.unmatched_domains
+        if not unmatched_domains:
             return
 
-        print(f"\n[!] Warning: Found {len(self.unmatched_domains)} domains with 'unclassified' labels")
+        print(f"\n[!] Warning: Found {len(unmatched_domains)} domains with 'unclassified' labels")
         print("Top 10 unmatched domains:")
-        for domain in sorted(list(self.unmatched_domains))[:10]:
+        for domain in sorted(unmatched_domains)[:10]:
             print(f"  - {domain}")
         print("\nConsider adding these to your source labels file for better classification in the future.")
 
@@ -4,12 +4,15 @@ Generate domain labels from crawl data and existing labels.
 Creates a new labels file with domains from crawl data and their classifications.
 """
 
-import json
 import sys
 import argparse
 from pathlib import Path
 from typing import Dict, Set, Any
-import tldextract
+from urllib.parse import urlparse
+
+import orjson
+
+from common.domains import netloc_to_domain
 
 class DomainLabelGenerator:
     def __init__(self, known_labels: Dict[str, str]):
@@ -20,8 +23,7 @@ class DomainLabelGenerator:
     def extract_domain(url: str) -> str:
         """Extract registered domain from URL."""
         try:
-            extracted = tldextract.extract(url)
-            return f"{extracted.domain}.{extracted.suffix}"
+            return netloc_to_domain(urlparse(url).netloc or url)
         except Exception as e:
             raise ValueError(f"Failed to extract domain from URL: {url} - {e}")
 
@@ -63,14 +65,14 @@ def load_json_file(path: Path) -> Any:
         raise FileNotFoundError(f"File not found: {path}")
     if not path.is_file():
         raise ValueError(f"Path is not a file: {path}")
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
 
 def save_json_file(data: Any, path: Path) -> None:
     """Save data to JSON file with directory creation."""
     path.parent.mkdir(parents=True, exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+    with open(path, "wb") as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2))
 
 def main():
     DEFAULT_LABELS_PATH = "data/config/source_labels.json"
@@ -3,14 +3,58 @@
 Analyze content reuse across crawled documents by creating a map of content hashes to sources.
 """
 
-import json
-import hashlib
+import os
 import argparse
 import sys
+import multiprocessing as mp
 from pathlib import Path
 from urllib.parse import urlparse
-from typing import Dict, List, Any
-from glob import glob
+from typing import Dict, Iterator, List, Tuple, Any
+import orjson
+import xxhash
+
+def _dumps_indented(obj: Any) -> bytes:
+    """Serialize obj as UTF-8 JSON with 2-space indentation."""
+    return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+
+def _extract_entries(file_path: str) -> List[Tuple[str, str, Dict[str, Any]]]:
+    """Hash the snippets of one crawl file into (content_hash, representative_snippet, source) rows."""
+    rows = []
+    file_path = Path(file_path)
+    crawl_file = file_path.name
+    # Boilerplate snippets repeat many times within a file, hash each distinct one once
+    file_hashes: Dict[str, str] = {}
+
+    for entry in ContentReuseAnalyzer.process_file(file_path):
+        snippet = entry.get("snippet", "").strip()
+        if not snippet:
+            continue
+
+        # Slice once and reuse it, text[:1000] on a string that short hands back the same object
+        snippet_head = snippet[:1000]
+        content_hash = file_hashes.get(snippet_head)
+        if content_hash is None:
+            content_hash = file_hashes[snippet_head] = ContentReuseAnalyzer.generate_content_hash(snippet_head)
+        domain = ContentReuseAnalyzer.normalize_domain(entry["source"])
+
+        rows.append((content_hash, snippet_head[:200], {
+            "domain": domain,
+            "url": entry["source"],
+            "label": entry.get("label", "unclassified"),
+            "crawl_file": crawl_file,
+            "snippet": snippet_head
+        }))
+
+    return rows
+
+def _iter_file_rows(file_paths: List[str]) -> Iterator[List[Tuple[str, str, Dict[str, Any]]]]:
+    """Yield each file's rows in listing order, extracting them in a process pool when there are several files."""
+    if len(file_paths) < 2:
+        yield from map(_extract_entries, file_paths)
+        return
+    # imap hands back one file's rows at a time, so every file's rows are never held at once
+    with mp.Pool(processes=min(len(file_paths), os.cpu_count() or 1)) as pool:
+        yield from pool.imap(_extract_entries, file_paths)
 
 class ContentReuseAnalyzer:
     def __init__(self, input_dir: str, output_path: str):
@@ -29,56 +73,57 @@ class ContentReuseAnalyzer:
 
     @staticmethod
     def generate_content_hash(text: str) -> str:
-        """Generate SHA256 hash of text content."""
-        return hashlib.sha256(text[:1000].encode("utf-8")).hexdigest()
+        """Generate a 128-bit xxh3 fingerprint of text content.
 
-    def process_file(self, file_path: Path) -> List[Dict[str, Any]]:
+        The hash only groups identical snippets, so a fast non-cryptographic hash is enough.
+        """
+        return xxhash.xxh3_128_hexdigest(text[:1000].encode("utf-8"))
+
+    @staticmethod
+    def process_file(file_path: Path) -> List[Dict[str, Any]]:
         """Process a single crawled file and extract entries."""
         try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            with open(file_path, "rb") as f:
+                return orjson.loads(f.read())
+        except orjson.JSONDecodeError as e:
             print(f"[!] Error processing {file_path.name}: {e}")
             return []
 
     def build_reuse_map(self) -> Dict[str, Dict[str, Any]]:
         """Build a map of content hashes to their sources."""
         reuse_map = {}
-        file_pattern = self.input_dir / "matches_*_labeled.json"
-
-        for file_path in glob(str(file_pattern)):
-            entries = self.process_file(Path(file_path))
-            if not entries:
-                continue
-
-            for entry in entries:
-                snippet = entry.get("snippet", "").strip()
-                if not snippet:
-                    continue
-
-                content_hash = self.generate_content_hash(snippet)
-                domain = self.normalize_domain(entry["source"])
-
+        # Same selection as the matches_*_labeled.json glob, from a single directory listing
+        prefix, suffix = "matches_", "_labeled.json"
+        file_paths = [
+            entry.path for entry in os.scandir(self.input_dir)
+            if entry.name.startswith(prefix) and entry.name.endswith(suffix)
+            and len(entry.name) >= len(prefix) + len(suffix) and entry.is_file()
+        ]
+
+        # Parsing and hashing are independent per file, so fan the files out and merge in listing order
+        for rows in _iter_file_rows(file_paths):
+            for content_hash, representative, source in rows:
                 if content_hash not in reuse_map:
                     reuse_map[content_hash] = {
-                        "representative_snippet": snippet[:200],
+                        "representative_snippet": representative,
                         "sources": []
                     }
-
-                reuse_map[content_hash]["sources"].append({
-                    "domain": domain,
-                    "url": entry["source"],
-                    "label": entry.get("label", "unclassified"),
-                    "crawl_file": Path(file_path).name,
-                    "snippet": snippet[:1000]
-                })
+                reuse_map[content_hash]["sources"].append(source)
 
         return reuse_map
 
     def save_results(self, reuse_data: Dict[str, Any]) -> None:
-        """Save the reuse map to JSON file."""
-        with open(self.output_path, "w", encoding="utf-8") as f:
-            json.dump(reuse_data, f, indent=2, ensure_ascii=False)
+        """Save the reuse map to JSON file, serializing one hash entry at a time."""
+        with open(self.output_path, "wb") as f:
+            if not reuse_data:
+                f.write(b"{}")
+                return
+            separator = b"{"
+            for content_hash, group in reuse_data.items():
+                # Indent each entry one level, JSON strings never hold raw newlines so only the layout changes
+                f.write(separator + b"\n  " + _dumps_indented(content_hash) + b": " + _dumps_indented(group).replace(b"\n", b"\n  "))
+                separator = b","
+            f.write(b"\n}")
 
     def run(self) -> None:
         """Execute the analysis pipeline."""
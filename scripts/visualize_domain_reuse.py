@@ -3,14 +3,14 @@
 Visualize domain reuse anomalies as an interactive network graph.
 """
 
-import json
 import argparse
 import sys
 from pathlib import Path
-from collections import defaultdict
-from typing import Dict, List, DefaultDict, Tuple
+from itertools import combinations
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
 
-import networkx as nx
+import ijson
+import orjson
 from pyvis.network import Network
 
 class DomainGraphVisualizer:
@@ -20,43 +20,56 @@ class DomainGraphVisualizer:
         "conspiratorial": "#FF9800",  # orange
         "unclassified": "#9E9E9E"  # gray
     }
+    # Freeze the layout once the initial stabilization is done so the browser stops simulating every frame
+    FREEZE_LAYOUT_JS = 'network.once("stabilizationIterationsDone", function() { network.setOptions({physics: false}); });'
 
     def __init__(self, input_path: str, labels_path: str, output_path: str):
         self.input_path = Path(input_path)
         self.labels_path = Path(labels_path)
         self.output_path = Path(output_path)
-        self.output_path.parent.mkdir(parents=True, exist_ok=True)
 
-    def load_data(self) -> Tuple[List[Dict], Dict[str, str]]:
-        """Load anomalies and labels data with validation."""
+    @staticmethod
+    def _load_json(path: Path) -> Any:
+        """Load a JSON file with orjson."""
+        with open(path, "rb") as f:
+            return orjson.loads(f.read())
+
+    @staticmethod
+    def _iter_anomalies(path: Path) -> Iterator[Dict]:
+        """Yield anomaly entries from the anomalies file, parsing them one at a time with ijson."""
+        with open(path, "rb") as f:
+            try:
+                yield from ijson.items(f, "item")
+            except ijson.JSONError as e:
+                raise RuntimeError(f"Failed to load data: {e}")
+
+    def load_data(self) -> Tuple[Iterator[Dict], Dict[str, str]]:
+        """Load labels and set up a stream over the anomalies with validation."""
         try:
-            with open(self.input_path, "r", encoding="utf-8") as f:
-                anomalies = json.load(f)
-            with open(self.labels_path, "r", encoding="utf-8") as f:
-                labels = json.load(f)
-            return anomalies, labels
-        except (FileNotFoundError, json.JSONDecodeError) as e:
+            # The anomalies file can be large, it is only parsed lazily but a missing file still fails early
+            if not self.input_path.is_file():
+                raise FileNotFoundError(f"Input file not found: {self.input_path}")
+            labels = self._load_json(self.labels_path)
+            return self._iter_anomalies(self.input_path), labels
+        except (FileNotFoundError, orjson.JSONDecodeError) as e:
             raise RuntimeError(f"Failed to load data: {e}")
 
-    def build_network_graph(self, anomalies: List[Dict]) -> nx.Graph:
-        """Construct network graph from anomalies data."""
-        G = nx.Graph()
-        grouped: DefaultDict[str, List] = defaultdict(list)
-
-        for entry in anomalies:
-            grouped[entry["issue"]].append(entry)
-
-        for cluster in grouped.values():
-            for anomaly in cluster:
-                domains = [d["domain"] for d in anomaly["reused_on"]]
-                for i, domain in enumerate(domains):
-                    if not G.has_node(domain):
-                        G.add_node(domain)
-                    for j in range(i + 1, len(domains)):
-                        G.add_edge(domain, domains[j])
-        return G
-
-    def visualize_graph(self, G: nx.Graph, labels: Dict[str, str]) -> None:
+    def build_network_graph(self, anomalies: Iterable[Dict]) -> Tuple[List[str], List[Tuple[str, str]]]:
+        """Construct the network graph from anomalies data as lists of nodes and undirected edges."""
+        # Dicts dedupe domains and pairs repeated across anomalies while keeping first-seen order
+        nodes: Dict[str, None] = {}
+        edges: Dict[Tuple[str, str], None] = {}
+        for anomaly in anomalies:
+            domains = dict.fromkeys(d["domain"] for d in anomaly["reused_on"])
+            nodes.update(domains)
+            for a, b in combinations(domains, 2):
+                # Edges are undirected, a pair seen in either order is the same edge
+                if (b, a) not in edges:
+                    edges[(a, b)] = None
+
+        return list(nodes), list(edges)
+
+    def visualize_graph(self, nodes: List[str], edges: List[Tuple[str, str]], labels: Dict[str, str]) -> None:
         """Generate interactive visualization using PyVis."""
         net = Network(
             notebook=False,
@@ -68,18 +81,18 @@ class DomainGraphVisualizer:
             cdn_resources="in_line"
         )
 
-        for node in G.nodes:
-            label_type = labels.get(node, "unclassified")
-            net.add_node(
-                node,
-                label=node,
-                color=self.DEFAULT_COLOR_MAP.get(label_type, "#9E9E9E"),
-                title=f"{node}\nType: {label_type}",
-                size=15
-            )
+        label_types = [labels.get(node, "unclassified") for node in nodes]
+        # add_nodes() still calls add_node() per node, it only keeps the per-node attributes together here
+        net.add_nodes(
+            nodes,
+            label=nodes,
+            color=[self.DEFAULT_COLOR_MAP.get(label_type, "#9E9E9E") for label_type in label_types],
+            title=[f"{node}\nType: {label_type}" for node, label_type in zip(nodes, label_types)],
+            size=[15] * len(nodes)
+        )
 
-        for edge in G.edges:
-            net.add_edge(edge[0], edge[1], width=0.5)
+        # Edges are already unique, add_edge() would rescan every existing edge for each new one
+        net.edges.extend({"from": a, "to": b, "width": 0.5} for a, b in edges)
 
         net.set_options("""
         {
@@ -93,6 +106,10 @@ class DomainGraphVisualizer:
                     "inherit": true
                 }
             },
+            "interaction": {
+                "hideEdgesOnDrag": true,
+                "hideEdgesOnZoom": true
+            },
             "physics": {
                 "forceAtlas2Based": {
                     "gravitationalConstant": -50,
@@ -111,7 +128,11 @@ class DomainGraphVisualizer:
         }
         """)
 
-        net.save_graph(str(self.output_path))
+        html = net.generate_html()
+        # Hook into the drawGraph() function of pyvis' template, without the anchor physics simply keeps running
+        html = html.replace("return network;", f"{self.FREEZE_LAYOUT_JS}\n                  return network;", 1)
+        self.output_path.parent.mkdir(parents=True, exist_ok=True)
+        self.output_path.write_text(html, encoding="utf-8")
 
     def run(self) -> None:
         """Execute the visualization pipeline."""
@@ -119,10 +140,10 @@ class DomainGraphVisualizer:
         anomalies, labels = self.load_data()
 
         print("[*] Building network graph")
-        graph = self.build_network_graph(anomalies)
+        nodes, edges = self.build_network_graph(anomalies)
 
         print(f"[*] Generating visualization at {self.output_path}")
-        self.visualize_graph(graph, labels)
+        self.visualize_graph(nodes, edges, labels)
 
         print(f"[✓] Successfully saved visualization to {self.output_path}")
 
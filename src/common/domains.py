@@ -0,0 +1,13 @@
+from functools import lru_cache
+
+import tldextract
+
+# Uses the suffix list snapshot bundled with tldextract, so runs never refresh it over the network
+EXTRACT = tldextract.TLDExtract(cache_dir=".cache/tldextract", suffix_list_urls=(), fallback_to_snapshot=True)
+
+# Crawl entries repeat the same hosts, so lookups are cached on the netloc rather than the full URL
+@lru_cache(maxsize=100_000)
+def netloc_to_domain(netloc: str) -> str:
+    """Return the registered domain of a netloc."""
+    extracted = EXTRACT(netloc)
+    return f"{extracted.domain}.{extracted.suffix}"
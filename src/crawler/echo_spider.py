@@ -6,13 +6,20 @@ This script accepts a seed url and then
   - fetches candidate articles and checks text similarity to find likely echoes and reposts
 """
 import argparse
+import contextlib
+import hashlib
+import tempfile
 import time
 import os
-import json
-from urllib.parse import urlparse
+import re
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, unquote, urlencode, urlparse
 
-from newspaper import Article
+import requests
+from newspaper import Article, Config, network
 from dotenv import load_dotenv
+import orjson
 
 from search_engines import (
     search_duckduckgo,
@@ -20,14 +27,16 @@ from search_engines import (
     search_gdelt_variants,
 )
 
-from similarity.detector import is_match
-
 DEFAULTS: dict = {
     "output_dir": "data/crawled",
+    # Parsed article texts, reused across runs unless --no-cache is given
+    "article_cache_dir": "data/cache/articles",
     # Default number of sentences and max words
     "get_top_sentences": {"n": 5, "max_words": 20},
     "similarity_threshold": 0.80,
     "delay_seconds": 2,
+    # Candidate articles fetched concurrently, one site at a time per worker
+    "fetch_workers": 8,
     # Default limit: max number of urls collected per search
     "gdelt": {
         "limit": 10,
@@ -35,20 +44,76 @@ DEFAULTS: dict = {
     },
 }
 
-os.makedirs(DEFAULTS["output_dir"], exist_ok=True)
+# Sentence boundaries: ., ! or ? followed by whitespace (but not after initials like U.S. or J.), or a line break
+_SENTENCE_END = re.compile(r"(?<=[.!?])(?<!\b[A-Z]\.)\s+|\n+")
+
+# Quotes stripped or straightened in search snippets
+_QUOTE_TRANS = str.maketrans({'"': "", "“": "", "”": "", "’": "'", "‘": "'"})
+
+# Query parameters that only track the referrer and never change the article
+TRACKING_PARAMS = {"fbclid", "gclid", "ocid", "cmpid", "ref"}
+
+# Shared newspaper settings, only the article text is used so the top image is never downloaded to be scored
+ARTICLE_CONFIG = Config()
+ARTICLE_CONFIG.fetch_images = False
+ARTICLE_CONFIG.memoize_articles = False
+
+# Keep-alive session shared by all article downloads, so repeat hosts reuse their connections
+SESSION = requests.Session()
+
+
+def _article_cache_path(url: str) -> str:
+    """Return the cache file holding the parsed text of a url"""
+    key = hashlib.blake2b(url.encode("utf-8"), digest_size=16).hexdigest()
+    return os.path.join(DEFAULTS["article_cache_dir"], f"{key}.txt")
+
 
+def is_article_cached(url: str) -> bool:
+    """Check whether the parsed text of a url is already cached"""
+    return os.path.exists(_article_cache_path(url))
+
+
+def extract_article_text(url: str, use_cache: bool = True) -> str | None:
+    """Download and parse newpaper article, reusing the on-disk cache unless use_cache is False"""
+    cache_path = _article_cache_path(url)
+    if use_cache:
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            pass
 
-def extract_article_text(url: str) -> str | None:
-    """Download and parse newpaper article"""
     try:
-        article = Article(url)
-        article.download()
+        article = Article(url, config=ARTICLE_CONFIG)
+        resp = SESSION.get(
+            url,
+            headers={"User-Agent": article.config.browser_user_agent},
+            timeout=article.config.request_timeout,
+        )
+        resp.raise_for_status()
+        # Let newspaper decode the response the same way its own download() would
+        article.download(input_html=network.get_html_2XX_only(url, article.config, response=resp))
         article.parse()
-        return article.text
+        text = article.text
     except Exception as e:
         print(f"[!] Failed to extract from {url}: {e}")
         return None
 
+    # Failed downloads and pages that parse to no text are not cached so the next run retries them
+    if use_cache and text.strip():
+        os.makedirs(DEFAULTS["article_cache_dir"], exist_ok=True)
+        # Write to a temp file first so a concurrent reader never sees a partial text
+        fd, tmp_path = tempfile.mkstemp(dir=DEFAULTS["article_cache_dir"], suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            print(f"[!] Failed to cache article {url}: {e}")
+            with contextlib.suppress(FileNotFoundError):
+                os.unlink(tmp_path)
+    return text
+
 
 def get_top_sentences(text: str, n: int | None = None, max_words: int | None = None) -> list[str]:
     """Produce snippets to be used as search queries"""
@@ -56,22 +121,17 @@ def get_top_sentences(text: str, n: int | None = None, max_words: int | None = N
     n = cfg["n"] if n is None else n
     max_words = cfg["max_words"] if max_words is None else max_words
 
-    # Keep "long enough" fragments so we avoid titles/captions/etc
-    sentences = [s.strip() for s in text.split('.') if len(s.strip()) > 25]
-
     short_snippets: list[str] = []
-    for s in sentences[:n]:
+    for s in _SENTENCE_END.split(text):
+        if len(short_snippets) >= n:
+            break
+        # Keep "long enough" fragments so we avoid titles/captions/etc
+        s = s.strip().rstrip(".!?")
+        if len(s) <= 25:
+            continue
         # Replace quotes to avoid nested-quote issues in search queries
-        s = (
-            s.replace('"', "")
-             .replace("“", "")
-             .replace("”", "")
-             .replace("’", "'")
-             .replace("‘", "'")
-        )
-        words = s.split()
-        snippet = ' '.join(words[:max_words]) if len(words) > max_words else ' '.join(words)
-        short_snippets.append(f'"{snippet}"')
+        words = s.translate(_QUOTE_TRANS).split()
+        short_snippets.append(f'"{" ".join(words[:max_words])}"')
 
     return short_snippets
 
@@ -85,6 +145,49 @@ def _domain_of(u: str) -> str:
         return ""
 
 
+def _canonical_url(u: str) -> str:
+    """Return a key for a URL that ignores scheme, www., fragment, percent-encoding, tracking params and a trailing slash"""
+    try:
+        parts = urlparse(u)
+    except ValueError:
+        # Malformed URLs such as an unclosed IPv6 bracket are deduplicated on the raw string
+        return u
+    domain = parts.netloc.lower().removeprefix("www.")
+    path = unquote(parts.path).rstrip("/")
+    params = parse_qsl(parts.query, keep_blank_values=True)
+    query = urlencode([(k, v) for k, v in params if k not in TRACKING_PARAMS and not k.startswith("utm_")])
+    return f"{domain}{path}?{query}" if query else f"{domain}{path}"
+
+
+def fetch_candidates(urls: list[str], delay: float, workers: int, use_cache: bool = True) -> dict[str, str | None]:
+    """
+    Fetch candidate article texts concurrently, keyed by url
+    Urls are grouped by domain and each group is fetched by a single worker,
+    so a site still sees `delay` seconds between requests while different sites are fetched in parallel.
+    Cached articles are read without touching the site or waiting
+    """
+    by_domain: defaultdict[str, list[str]] = defaultdict(list)
+    for url in dict.fromkeys(urls):
+        by_domain[_domain_of(url)].append(url)
+
+    def fetch_domain(domain_urls: list[str]) -> dict[str, str | None]:
+        texts: dict[str, str | None] = {}
+        requested = False
+        for url in domain_urls:
+            if not (use_cache and is_article_cached(url)):
+                if requested:
+                    time.sleep(delay)
+                requested = True
+            texts[url] = extract_article_text(url, use_cache=use_cache)
+        return texts
+
+    texts: dict[str, str | None] = {}
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for domain_texts in pool.map(fetch_domain, by_domain.values()):
+            texts.update(domain_texts)
+    return texts
+
+
 def crawl_and_compare(
     seed_url: str,
     engine: str,
@@ -92,6 +195,8 @@ def crawl_and_compare(
     *,
     threshold: float | None = None,
     delay: int | None = None,
+    workers: int | None = None,
+    use_cache: bool = True,
     gdelt_start: str | None = None,
     gdelt_end: str | None = None,
     gdelt_timespan: str | None = None,
@@ -105,9 +210,16 @@ def crawl_and_compare(
       - fetch & compare candidate texts against the seed text
       - save matches as JSON
     """
+    # Imported here as it pulls in torch and loads the embedding model, which --help and bad arguments don't need
+    from similarity.detector import compare, compute_fuzzy_ratio, max_possible_score, prepare, prepare_many, warm_up
+
+    # The model loads while the seed article is downloaded
+    warm_up()
+
     # Resolve configuration defaults
     threshold = DEFAULTS["similarity_threshold"] if threshold is None else threshold
     delay = DEFAULTS["delay_seconds"] if delay is None else delay
+    workers = DEFAULTS["fetch_workers"] if workers is None else workers
 
     # GDELT specific defaults
     gd_cfg = DEFAULTS["gdelt"]
@@ -115,7 +227,7 @@ def crawl_and_compare(
     gdelt_limit = gd_cfg["limit"] if gdelt_limit is None else gdelt_limit
 
     print(f"[*] Extracting seed content from: {seed_url}")
-    seed_text = extract_article_text(seed_url)
+    seed_text = extract_article_text(seed_url, use_cache=use_cache)
     if not seed_text:
         print("[!] Could not extract seed content. Exiting.")
         return
@@ -126,10 +238,10 @@ def crawl_and_compare(
     found_matches: list[dict] = []
 
     seed_domain = _domain_of(seed_url)
+    # Canonical URLs already handled, so the seed and URLs returned for several queries are only fetched once
+    seen_urls = {_canonical_url(seed_url)}
 
-    for sent in key_sentences:
-        print(f"[+] Searching with {engine}: {sent}")
-
+    def search(sent: str) -> list[str]:
         if engine == "gdelt":
             q = sent.strip('"')  # GDELT prefers unquoted bag/NEAR terms
             results = search_gdelt_variants(
@@ -144,38 +256,69 @@ def crawl_and_compare(
             results = search_duckduckgo(sent)
         else:
             results = search_google_cse(sent, config["GOOGLE_API_KEY"], config["GOOGLE_CSE_ID"])
-
-        print(f"[+] Found {len(results)} results")
+        # Sleeping inside the search keeps queries spaced by the delay even while they run ahead
         time.sleep(delay)
-
-        for url in results:
-            print(f"    - {url}")
-            # Skip self-references back to the seed source.
-            if seed_url in url:
-                continue
-
-            candidate_text = extract_article_text(url)
-            if not candidate_text or len(candidate_text) < 100:
-                # Very short articles are not worth comparing
-                continue
-
-            match, score = is_match(seed_text, candidate_text, threshold=threshold)
-
-            if match:
-                print(f"[✓] Match found: {url} (similarity={score:.2f})")
-                found_matches.append(
-                    {
-                        "source": url,
-                        "similarity": score,
-                        "snippet": candidate_text[:500],
-                    }
-                )
-
-            time.sleep(delay)
-
+        return results
+
+    # Queries stay sequential to respect the engines' rate limits, but the next one runs
+    # in the background while the current round's candidates are fetched and compared
+    with ThreadPoolExecutor(max_workers=1) as search_pool:
+        pending = search_pool.submit(search, key_sentences[0]) if key_sentences else None
+
+        # Seed features are computed once and reused for every candidate of every round, encoding
+        # them only after the first query is submitted lets that search overlap the model load
+        seed_features = prepare(seed_text)
+
+        for i, sent in enumerate(key_sentences):
+            print(f"[+] Searching with {engine}: {sent}")
+            results = pending.result()
+            if i + 1 < len(key_sentences):
+                pending = search_pool.submit(search, key_sentences[i + 1])
+
+            print(f"[+] Found {len(results)} results")
+
+            for url in results:
+                print(f"    - {url}")
+
+            # Skip self-references back to the seed source and URLs compared in an earlier round
+            candidates = []
+            for url in results:
+                key = _canonical_url(url)
+                if key not in seen_urls:
+                    seen_urls.add(key)
+                    candidates.append(url)
+            candidate_texts = fetch_candidates(candidates, delay, workers, use_cache=use_cache)
+
+            # Very short articles are not worth comparing
+            comparable = [
+                (url, candidate_texts[url]) for url in candidates
+                if candidate_texts[url] and len(candidate_texts[url]) >= 100
+            ]
+            # The fuzzy ratio is cheap, candidates it already rules out are never encoded
+            plausible = []
+            for url, candidate_text in comparable:
+                fuzzy = compute_fuzzy_ratio(seed_text, candidate_text)
+                if max_possible_score(fuzzy) >= threshold:
+                    plausible.append((url, candidate_text, fuzzy))
+            # Encode the whole round in one batch instead of one model call per candidate
+            candidate_features = prepare_many([text for _, text, _ in plausible])
+
+            for (url, candidate_text, fuzzy), features in zip(plausible, candidate_features):
+                match, score = compare(seed_features, features, threshold=threshold, fuzzy=fuzzy)
+                if match:
+                    print(f"[✓] Match found: {url} (similarity={score:.2f})")
+                    found_matches.append(
+                        {
+                            "source": url,
+                            "similarity": score,
+                            "snippet": candidate_text[:500],
+                        }
+                    )
+
+    os.makedirs(DEFAULTS["output_dir"], exist_ok=True)
     out_file = os.path.join(DEFAULTS["output_dir"], f"matches_{engine}.json")
-    with open(out_file, "w", encoding="utf-8") as f:
-        json.dump(found_matches, f, indent=2, ensure_ascii=False)
+    with open(out_file, "wb") as f:
+        f.write(orjson.dumps(found_matches, option=orjson.OPT_INDENT_2))
     print(f"[*] Saved {len(found_matches)} matches to {out_file}")
 
 
@@ -191,7 +334,9 @@ if __name__ == "__main__":
     parser.add_argument("--gdelt-end", help="GDELT ENDDATETIME, should be YYYYMMDD or YYYYMMDDHHMMSS or YYYY-MM-DD")
     parser.add_argument("--gdelt-timespan", help="GDELT TIMESPAN (e.g., '7d', '30d', '1week', '3months'), ignored if start/end provided")
     parser.add_argument("--threshold", type=float, default=DEFAULTS["similarity_threshold"], help=f"Similarity threshold for matches (default: {DEFAULTS['similarity_threshold']})")
-    parser.add_argument("--delay", type=int, default=DEFAULTS["delay_seconds"], help=f"Delay in seconds between each query and match check (default: {DEFAULTS['delay_seconds']})")
+    parser.add_argument("--delay", type=int, default=DEFAULTS["delay_seconds"], help=f"Delay in seconds between each query and between requests to the same site (default: {DEFAULTS['delay_seconds']})")
+    parser.add_argument("--workers", type=int, default=DEFAULTS["fetch_workers"], help=f"Number of sites to fetch candidate articles from concurrently (default: {DEFAULTS['fetch_workers']})")
+    parser.add_argument("--no-cache", action="store_true", help="Download every article again instead of reusing cached texts")
     args = parser.parse_args()
 
     # Get Google API keys stored in .env
@@ -211,6 +356,8 @@ if __name__ == "__main__":
         config,
         threshold=args.threshold,
         delay=args.delay,
+        workers=args.workers,
+        use_cache=not args.no_cache,
         gdelt_start=gd_start,
         gdelt_end=gd_end,
         gdelt_timespan=gd_span,
@@ -1,9 +1,16 @@
 #!/usr/bin/env python3
 """Search helpers"""
 import re
+import threading
+import time
 import requests
-from bs4 import BeautifulSoup
 from datetime import datetime
+from functools import lru_cache
+from lxml import etree, html as lxml_html
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import orjson
 
 DEFAULTS: dict = {
     "headers": {"User-Agent": "Mozilla/5.0"},
@@ -13,6 +20,8 @@ DEFAULTS: dict = {
         "limit": 10,
         "timespan": "30d",
         "timeout": 30,
+        # Seconds a query's results are reused within a run, short since results are sorted by recency
+        "cache_ttl": 600,
     },
     "gdelt_query": {
         "near_k": 10,
@@ -33,6 +42,30 @@ STOP = {
 # Allow list acronyms
 ACRONYM_ALLOW = {"NATO", "UAE", "EU", "US", "UK", "UN"}
 
+# Curly quotes and non-breaking spaces replaced in one pass by _normalize_text()
+NORMALIZE_TABLE = str.maketrans({"’": "'", "“": '"', "”": '"', "\u00a0": " "})
+
+# Keyword tokens picked from sentences by _tokens()
+TOKEN_RE = re.compile(r"[A-Za-z0-9][A-Za-z0-9\-]{1,}")
+# NEAR clause of a GDELT query, e.g. near10:"word word"
+NEAR_CLAUSE_RE = re.compile(r'\bnear\d+:"[^"]+"\s*')
+
+# Keep-alive session for the GDELT API and DuckDuckGo, so repeated queries reuse one connection per host
+# and transient errors are retried (GETs only, DuckDuckGo's form POSTs are never replayed)
+SESSION = requests.Session()
+SESSION.mount("https://", HTTPAdapter(
+    pool_connections=20,
+    pool_maxsize=20,
+    max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504]),
+))
+
+# Recent GDELT results by query and window, as (fetched_at, urls), shared by the search threads
+GDELT_CACHE: dict[tuple, tuple[float, list[str]]] = {}
+GDELT_CACHE_LOCK = threading.Lock()
+
+# Links of anchors carrying the result__a class among others, compiled once and evaluated by libxml2
+DDG_RESULT_HREFS = etree.XPath("//a[contains(concat(' ', normalize-space(@class), ' '), ' result__a ')]/@href", smart_strings=False)
+
 
 def search_duckduckgo(query: str, max_results: int | None = None, *, headers: dict | None = None) -> list[str]:
     """Lightweight HTML form search against DuckDuckGo's HTML endpoint"""
@@ -41,10 +74,8 @@ def search_duckduckgo(query: str, max_results: int | None = None, *, headers: di
     headers = DEFAULTS["headers"] if headers is None else headers
 
     try:
-        res = requests.post("https://html.duckduckgo.com/html/", data={"q": query}, headers=headers, timeout=30)
-        soup = BeautifulSoup(res.text, "lxml")
-        for a in soup.select("a.result__a"):
-            href = a.get("href")
+        res = SESSION.post("https://html.duckduckgo.com/html/", data={"q": query}, headers=headers, timeout=30)
+        for href in DDG_RESULT_HREFS(lxml_html.fromstring(res.text)):
             if href:
                 results.append(href)
             if len(results) >= max_results:
@@ -54,13 +85,18 @@ def search_duckduckgo(query: str, max_results: int | None = None, *, headers: di
     return results
 
 
+@lru_cache(maxsize=None)
+def _cse_service(api_key: str):
+    """Build the Custom Search client once per API key, so its discovery document and HTTP connection are reused"""
+    from googleapiclient.discovery import build
+    return build("customsearch", "v1", developerKey=api_key)
+
+
 def search_google_cse(query: str, api_key: str, cse_id: str, num: int | None = None) -> list[str]:
     """Google Custom Search API, requires API key & CSE ID"""
     num = DEFAULTS["google"]["num"] if num is None else num
     try:
-        from googleapiclient.discovery import build
-        service = build("customsearch", "v1", developerKey=api_key)
-        res = service.cse().list(q=query, cx=cse_id, num=num).execute()
+        res = _cse_service(api_key).cse().list(q=query, cx=cse_id, num=num).execute()
         return [item['link'] for item in res.get('items', [])]
     except Exception as e:
         print(f"[!] Google CSE failed: {e}")
@@ -69,13 +105,7 @@ def search_google_cse(query: str, api_key: str, cse_id: str, num: int | None = N
 
 def _normalize_text(s: str) -> str:
     """Normalize curly quotes to simpler ASCII-ish form"""
-    return (
-        s.replace("’", "'")
-         .replace("“", '"')
-         .replace("”", '"')
-         .replace("\u00a0", " ")
-         .strip()
-    )
+    return s.translate(NORMALIZE_TABLE).strip()
 
 
 def _tokens(sentence: str) -> list[str]:
@@ -83,21 +113,19 @@ def _tokens(sentence: str) -> list[str]:
     s = _normalize_text(sentence)
     # Start with alpha num, followed by 1+ of alpha num or a dash
     # (TODO: Check if dashes are valid, appears in split words)
-    raw = re.findall(r"[A-Za-z0-9][A-Za-z0-9\-]{1,}", s)
+    raw = TOKEN_RE.findall(s)
 
-    out: list[str] = []
-    seen: set[str] = set()
+    # Lowercased token to its first spelling, the dict keeps the tokens in order
+    out: dict[str, str] = {}
     for t in raw:
         tl = t.lower()
-        if tl in STOP:
+        if tl in out or tl in STOP:
             continue
         # Drop all < 3 char tokens unless whitelisted
         if len(t) < 3 and t.upper() not in ACRONYM_ALLOW:
             continue
-        if tl not in seen:
-            out.append(t)
-            seen.add(tl)
-    return out
+        out[tl] = t
+    return list(out.values())
 
 
 def _quote(words: list[str]) -> str:
@@ -130,8 +158,10 @@ def build_gdelt_queries(
         return []
 
     # Prefer named/acronym tokens first
-    named = [t for t in terms if t[0].isupper() or t.isupper()]
-    others = [t for t in terms if t not in named]
+    named: list[str] = []
+    others: list[str] = []
+    for t in terms:
+        (named if t[0].isupper() or t.isupper() else others).append(t)
     core = (named + others)[:max_terms]
 
     head = core[:3]  # strongest 3 for NEAR/phrase
@@ -157,14 +187,7 @@ def build_gdelt_queries(
     variants.append(" ".join([t for t in core if len(t) >= 3] + filters).strip())
 
     # De-duplicate and drop empties
-    seen: set[str] = set()
-    clean: list[str] = []
-    for q in variants:
-        q = " ".join(q.split())
-        if q and q not in seen:
-            seen.add(q)
-            clean.append(q)
-    return clean
+    return [q for q in dict.fromkeys(" ".join(q.split()) for q in variants) if q]
 
 
 def _retry_fix_query(q: str, head_text: str) -> str | None:
@@ -173,7 +196,7 @@ def _retry_fix_query(q: str, head_text: str) -> str | None:
 
     # Remove NEAR clause if it's flagged as invalid
     if "invalid near" in msg or "near search" in msg:
-        q = re.sub(r'\bnear\d+:"[^"]+"\s*', '', q).strip()
+        q = NEAR_CLAUSE_RE.sub('', q).strip()
         return q or None
 
     # Drop too-short tokens
@@ -194,17 +217,18 @@ def _gdelt_fmt(dtobj: datetime | str) -> str:
     if isinstance(dtobj, datetime):
         return dtobj.strftime("%Y%m%d%H%M%S")
     s = str(dtobj).strip()
+    n = len(s)
 
     # YYYYMMDDHHMMSS
-    if re.fullmatch(r"\d{14}", s):
+    if n == 14 and s.isdecimal():
         return s
 
     # YYYYMMDD
-    if re.fullmatch(r"\d{8}", s):
+    if n == 8 and s.isdecimal():
         return s + "000000"
 
     # YYYY-MM-DD
-    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", s):
+    if n == 10 and s[4] == s[7] == "-" and (s[:4] + s[5:7] + s[8:]).isdecimal():
         return s.replace("-", "") + "000000"
     raise ValueError(f"Unsupported datetime format for GDELT: {dtobj!r}")
 
@@ -225,6 +249,12 @@ def search_gdelt_single(
     # HTTP timeout in seconds
     timeout = DEFAULTS["gdelt"]["timeout"] if timeout is None else timeout
 
+    key = (query, str(start), str(end), timespan, max_results)
+    with GDELT_CACHE_LOCK:
+        cached = GDELT_CACHE.get(key)
+    if cached and time.monotonic() - cached[0] < DEFAULTS["gdelt"]["cache_ttl"]:
+        return list(cached[1])
+
     params = {
         "query": query,
         "mode": "artlist",
@@ -243,7 +273,7 @@ def search_gdelt_single(
         params["timespan"] = timespan
 
     try:
-        r = requests.get(base, params=params, timeout=timeout, headers=DEFAULTS["headers"])
+        r = SESSION.get(base, params=params, timeout=timeout, headers=DEFAULTS["headers"])
         r.raise_for_status()
         ctype = (r.headers.get("content-type", "")).lower()
         if "application/json" not in ctype:
@@ -256,13 +286,22 @@ def search_gdelt_single(
                     fixed, max_results=max_results, start=start, end=end, timespan=timespan, timeout=timeout
                 )
             return []
-        data = r.json() or {}
+        # An empty body means no matches, not a failed search
+        if not r.content:
+            data = {}
+        else:
+            data = orjson.loads(r.content) or {}
         arts = data.get("articles", []) or []
-        return [a.get("url") for a in arts if a.get("url")]
+        urls = [u for a in arts if (u := a.get("url"))]
     except Exception as e:
         print(f"[!] GDELT search failed: {e}")
         return []
 
+    # Only successful responses are cached, failed queries are retried next time
+    with GDELT_CACHE_LOCK:
+        GDELT_CACHE[key] = (time.monotonic(), urls)
+    return list(urls)
+
 
 def search_gdelt_variants(
     sentence: str,
@@ -1,37 +1,104 @@
+import threading
+from collections import OrderedDict
+from typing import Any, NamedTuple
+
 from sentence_transformers import SentenceTransformer, util
-from fuzzywuzzy import fuzz
+from rapidfuzz import fuzz, utils
+
+MODEL_NAME = "all-MiniLM-L6-v2"
+
+# Loaded on first use by load_model(), the lock makes concurrent first calls share one load
+_model: SentenceTransformer | None = None
+_model_lock = threading.Lock()
+
+# Embeddings of recently encoded texts, oldest first, so repeated texts skip the forward pass
+EMBEDDING_CACHE_SIZE = 4096
+_embedding_cache: OrderedDict[str, Any] = OrderedDict()
+
+def load_model() -> SentenceTransformer:
+    """Return the sentence embedding model, loading it on the first call."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                model = SentenceTransformer(MODEL_NAME)
+                # Half precision on GPU halves memory and runs on tensor cores, CPUs stay on fp32
+                if model.device.type == "cuda":
+                    model.half()
+                _model = model
+    return _model
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+def warm_up() -> None:
+    """Start loading the model on a background thread, so it is ready by the time texts are compared."""
+    def load() -> None:
+        try:
+            load_model()
+        except Exception:
+            # Left to the next load_model() call, which retries and raises in the caller's thread
+            pass
+
+    threading.Thread(target=load, name="model-warm-up", daemon=True).start()
+
+class TextFeatures(NamedTuple):
+    """A text with its sentence embedding, computed once and reused across comparisons."""
+    text: str
+    embedding: Any
+
+def _encode_many(texts: list[str]) -> list[Any]:
+    """Return the embedding of each text, encoding only the ones not cached yet in a single batch."""
+    missing = [text for text in dict.fromkeys(texts) if text not in _embedding_cache]
+    if missing:
+        for text, embedding in zip(missing, load_model().encode(missing, convert_to_tensor=True)):
+            _embedding_cache[text] = embedding
+    embeddings = []
+    for text in texts:
+        _embedding_cache.move_to_end(text)
+        embeddings.append(_embedding_cache[text])
+    while len(_embedding_cache) > EMBEDDING_CACHE_SIZE:
+        _embedding_cache.popitem(last=False)
+    return embeddings
 
 def compute_semantic_similarity(text1: str, text2: str) -> float:
     """Compute cosine similarity between sentence embeddings."""
-    emb1 = model.encode(text1, convert_to_tensor=True)
-    emb2 = model.encode(text2, convert_to_tensor=True)
+    emb1, emb2 = _encode_many([text1, text2])
     return util.pytorch_cos_sim(emb1, emb2).item()
 
 def compute_fuzzy_ratio(text1: str, text2: str) -> float:
     """Compute fuzzy string matching score."""
-    return fuzz.token_set_ratio(text1, text2) / 100.0
+    # default_process lowercases and strips punctuation but, unlike fuzzywuzzy, keeps non-ASCII letters,
+    # so accented text scores differently than it used to, rounding keeps the whole-number scores
+    return round(fuzz.token_set_ratio(text1, text2, processor=utils.default_process)) / 100.0
 
-def is_match(text1: str, text2: str, threshold: float = 0.8) -> tuple[bool, float]:
+def prepare(text: str) -> TextFeatures:
+    """Compute the features of a text for use with compare()."""
+    return TextFeatures(text, _encode_many([text])[0])
+
+def prepare_many(texts: list[str]) -> list[TextFeatures]:
+    """Compute the features of many texts, encoding the uncached ones in a single batch."""
+    return [TextFeatures(text, embedding) for text, embedding in zip(texts, _encode_many(texts))]
+
+def max_possible_score(fuzzy: float) -> float:
+    """Return the best avg_score a pair with this fuzzy ratio can reach, i.e. with a perfect semantic similarity."""
+    return (fuzzy + 1.0) / 2
+
+def compare(
+    features1: TextFeatures, features2: TextFeatures, threshold: float = 0.8, fuzzy: float | None = None
+) -> tuple[bool, float]:
     """
-    Return whether texts are similar enough to be considered a match.
+    Return whether two prepared texts are similar enough to be considered a match.
+    The fuzzy ratio of the pair can be passed in when it was already computed.
     Returns a tuple: (match: bool, avg_score: float)
     """
-    semantic = compute_semantic_similarity(text1, text2)
-    fuzzy = compute_fuzzy_ratio(text1, text2)
+    semantic = util.pytorch_cos_sim(features1.embedding, features2.embedding).item()
+    if fuzzy is None:
+        fuzzy = compute_fuzzy_ratio(features1.text, features2.text)
     score = (semantic + fuzzy) / 2
     return score >= threshold, round(score, 3)
 
-# if __name__ == "__main__":
-#     import sys
-#     if len(sys.argv) < 3:
-#         print("Usage: python script.py 'text1' 'text2' [threshold]")
-#         sys.exit(1)
-
-#     text1 = sys.argv[1]
-#     text2 = sys.argv[2]
-#     threshold = float(sys.argv[3]) if len(sys.argv) > 3 else 0.8
-
-#     match, score = is_match(text1, text2, threshold)
-#     print(f"Match: {match}, Score: {score}")
\ No newline at end of file
+def is_match(text1: str, text2: str, threshold: float = 0.8) -> tuple[bool, float]:
+    """
+    Return whether texts are similar enough to be considered a match.
+    Returns a tuple: (match: bool, avg_score: float)
+    """
+    # Both texts go through the model as one batch
+    return compare(*prepare_many([text1, text2]), threshold)